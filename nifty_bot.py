@@ -1,17 +1,39 @@
 import asyncio
+import bisect
+import hashlib
 import os
+import random
+import re
+import sys
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import importlib.util
 from telegram import Bot
+from telegram.error import InvalidToken, TelegramError
+from telegram.request import HTTPXRequest
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+from datetime import datetime, timedelta, timezone
 import logging
 import csv
 import io
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
-import mplfinance as mpf
-import pandas as pd
+
+# orjson असेल तर fast JSON parsing/encoding, नसेल तर stdlib json
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    import json
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj).encode()
 
 # Logging setup
 logging.basicConfig(
@@ -20,6 +42,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# DHAN_DEBUG=1 असेल तरच raw request/response details log करतो
+if os.getenv("DHAN_DEBUG") == "1":
+    logger.setLevel(logging.DEBUG)
+
 # ========================
 # CONFIGURATION
 # ========================
@@ -37,6 +63,61 @@ DHAN_INSTRUMENTS_URL = "https://images.dhan.co/api-data/api-scrip-master.csv"
 DHAN_HISTORICAL_URL = f"{DHAN_API_BASE}/v2/charts/historical"
 DHAN_INTRADAY_URL = f"{DHAN_API_BASE}/v2/charts/intraday"
 
+# Updates मधला interval (seconds)
+UPDATE_INTERVAL = 300
+
+# Dhan 429 response मध्ये Retry-After नसेल तर इतके seconds थांबतो
+RATE_LIMIT_COOLDOWN = 60
+
+# सलग इतके Dhan failures (network error / 5xx) झाले तर BREAKER_COOLDOWN seconds requests थांबवतो
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 120
+
+# Retry backoff: BACKOFF_BASE पासून दर failure ला दुप्पट, BACKOFF_MAX पर्यंत (+ jitter)
+BACKOFF_BASE = 5
+BACKOFF_MAX = 300
+
+# Dhan error/invalid response body log मध्ये इतके bytes दाखवतो
+DHAN_ERROR_PREVIEW = 500
+
+# Dhan REST calls साठी threads (default executor खूप मोठा आहे)
+REST_WORKERS = 2
+
+# Dhan fetch fail झाला तर इतक्या seconds पर्यंत जुना option chain दाखवतो
+OPTION_CHAIN_STALE_LIMIT = 600
+
+# Messages मधले वेळ Indian time मध्ये दाखवतो (server UTC मध्ये चालतो)
+IST = timezone(timedelta(hours=5, minutes=30))
+
+# जुना (stale) option chain पाठवला तर message खाली ही ओळ जोडतो
+STALE_DATA_NOTE = "⚠️ Data as of %s IST (Dhan fetch failed)\n"
+
+# एक Telegram send (photo upload सह) इतक्या seconds पेक्षा जास्त अडकला तर सोडून देतो
+TELEGRAM_SEND_TIMEOUT = 30
+
+# Telegram photo caption ची max length
+TELEGRAM_CAPTION_LIMIT = 1024
+
+# Startup message - फक्त tracked symbols ची संख्या बदलते
+STARTUP_MESSAGE = (
+    "🤖 *Dhan Option Chain Bot Started!*\n\n"
+    "📊 Tracking {count} stocks/indices\n"
+    "⏱️ Updates every 5 minutes\n"
+    "📈 Features:\n"
+    "  • Candlestick Charts (Last 199 candles)\n"
+    "  • Option Chain: CE/PE LTP, OI, Volume\n"
+    "  • Greeks & Implied Volatility\n\n"
+    "✅ Powered by DhanHQ API v2\n"
+    "🚂 Deployed on Railway.app\n\n"
+    "_Market Hours: 9:15 AM - 3:30 PM (Mon-Fri)_"
+)
+
+# Exchange segment -> Dhan instrument type
+INSTRUMENT_TYPES = {
+    "IDX_I": "INDEX",
+    "NSE_EQ": "EQUITY",
+}
+
 # Stock/Index List - Symbol mapping
 STOCKS_INDICES = {
     # Indices
@@ -73,20 +154,292 @@ STOCKS_INDICES = {
     "TRENT": {"symbol": "TRENT", "segment": "NSE_EQ"},
 }
 
+# Scrip master CSV मधला (SEM_SEGMENT, trading symbol) -> आपला symbol
+SCRIP_MASTER_KEYS = {
+    ('I' if info['segment'] == "IDX_I" else 'E', info['symbol']): symbol
+    for symbol, info in STOCKS_INDICES.items()
+}
+
+# Telegram Markdown मधले special characters - translate table एकदाच तयार करतो
+_MARKDOWN_SPECIALS = '_*`['
+_MARKDOWN_ESCAPE_TABLE = str.maketrans({c: '\\' + c for c in _MARKDOWN_SPECIALS})
+_MARKDOWN_SPECIALS_RE = re.compile('([%s])' % re.escape(_MARKDOWN_SPECIALS))
+
+
+def escape_markdown(text):
+    """Telegram Markdown (legacy) साठी special characters escape करतो"""
+    return str(text).translate(_MARKDOWN_ESCAPE_TABLE)
+
+
+def bold_markdown(text):
+    """Legacy Markdown मध्ये text bold करतो
+    
+    *...* entity आत escape चालत नाही - special character आला तर bold बंद करून
+    escaped character टाकतो आणि नंतर bold परत सुरू करतो.
+    """
+    return "".join(
+        escape_markdown(part) if part in _MARKDOWN_SPECIALS else f"*{part}*"
+        for part in _MARKDOWN_SPECIALS_RE.split(str(text)) if part
+    )
+
+
+def to_float(value, default=0.0):
+    """API value float मध्ये convert करतो ("1,234.50" सारखे strings सुद्धा)"""
+    # Dhan JSON मध्ये बहुतेक values आधीच numbers असतात - exception शिवाय fast path
+    value_type = type(value)
+    if value_type is float:
+        return value
+    if value_type is int:
+        return float(value)
+    if value is None:
+        return default
+    try:
+        return float(str(value).replace(',', ''))
+    except ValueError:
+        return default
+
+
+# Historical candles columns म्हणून ठेवतो (प्रत्येक column ची एक list)
+CANDLE_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+# Option chain table चा fixed header (code block + column titles + ruler) - एकदाच तयार करतो
+OPTION_TABLE_HEADER = (
+    "```\n"
+    "Strike   CE-LTP  CE-OI  CE-Vol  PE-LTP  PE-OI  PE-Vol\n"
+    "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+)
+
+ATM_GREEKS_HEADER = "📈 *ATM Greeks & IV:*\n"
+
+# Option chain table ची एक row: ATM mark, strike, CE LTP/OI/Vol, PE LTP/OI/Vol (OI/Vol हजारात)
+OPTION_ROW_TEMPLATE = "%s%6.0f  %6.1f %6.0fK %6.0fK  %6.1f %6.0fK %6.0fK\n"
+
+# Option chain table साठी प्रत्येक CE/PE leg मधून लागणारे fields (या order मध्ये)
+OPTION_LEG_FIELDS = ('last_price', 'oi', 'volume')
+
+
+def option_leg_values(leg):
+    """CE/PE leg मधून LTP, OI, Volume floats म्हणून काढतो"""
+    return [to_float(leg.get(field)) for field in OPTION_LEG_FIELDS]
+
+
+def backoff_delay(attempt):
+    """attempt नुसार exponential backoff + 0-1s jitter (सलग retries एकाच वेळी होत नाहीत)"""
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) + random.random()
+
+
+def response_preview(response):
+    """Response body चे पहिले DHAN_ERROR_PREVIEW bytes text म्हणून (पूर्ण body decode न करता)"""
+    return response.content[:DHAN_ERROR_PREVIEW].decode('utf-8', 'replace')
+
+
+def payload_digest(obj):
+    """API data चा छोटा hash - मागच्या cycle पासून data बदलला का ते ओळखण्यासाठी"""
+    return hashlib.blake2b(json_dumps(obj), digest_size=16).digest()
+
+
+# Chart libraries (matplotlib/mplfinance/pandas) heavy आहेत - module import वेळी
+# load न करता फक्त installed आहेत का ते check करतो (find_spec module execute करत नाही)
+CHARTS_AVAILABLE = all(
+    importlib.util.find_spec(name) is not None
+    for name in ("matplotlib", "mplfinance", "pandas")
+)
+_chart_libs = None
+
+
+def load_chart_libs():
+    """matplotlib, mplfinance, pandas पहिल्या chart वेळीच import करतो"""
+    global _chart_libs
+    if _chart_libs is None:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        import mplfinance as mpf
+        import pandas as pd
+        _chart_libs = (plt, mpf, pd)
+    return _chart_libs
+
+
+_CHART_LIB_NAMES = ("plt", "mpf", "pd")
+
+
+def __getattr__(name):
+    """`from nifty_bot import plt` केल्यावरच chart libraries load करतो (PEP 562)"""
+    if name in _CHART_LIB_NAMES:
+        value = load_chart_libs()[_CHART_LIB_NAMES.index(name)]
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# ========================
+# CHART RENDERING
+# ========================
+
+def render_candlestick_chart(candles, symbol, spot_price):
+    """Candlestick chart तयार करून PNG bytes परत देतो
+    
+    Chart process pool मध्ये render होतो - म्हणून function module-level आहे (pickle होण्यासाठी).
+    """
+    try:
+        plt, mpf, pd = load_chart_libs()
+        
+        # DataFrame columns मधून एकदाच तयार करतो (row-wise dicts नाहीत)
+        df = pd.DataFrame({
+            'Open': [to_float(value) for value in candles['open']],
+            'High': [to_float(value) for value in candles['high']],
+            'Low': [to_float(value) for value in candles['low']],
+            'Close': [to_float(value) for value in candles['close']],
+            'Volume': [to_float(value) for value in candles['volume']]
+        })
+        df['Volume'] = df['Volume'].astype('int64')  # Float to int conversion
+        
+        # Timestamps vectorized convert करतो - Dhan start_Time epoch seconds (UTC) देतो,
+        # ते IST wall time मध्ये; string timestamps असतील तर ते तसेच parse करतो
+        raw = pd.Series([ts if ts else None for ts in candles['timestamp']], dtype=object)
+        epochs = pd.to_numeric(raw, errors='coerce')
+        dates = pd.to_datetime(epochs, unit='s', utc=True).dt.tz_convert(IST).dt.tz_localize(None)
+        if epochs.isna().any():
+            dates = dates.fillna(pd.to_datetime(raw.where(epochs.isna()), errors='coerce'))
+        df.index = pd.DatetimeIndex(dates.fillna(pd.Timestamp.now(IST).tz_localize(None)), name='Date')
+        
+        # Check if enough data
+        if len(df) < 2:
+            logger.warning("%s: Not enough candles (%s) for chart", symbol, len(df))
+            return None
+        
+        # Chart style
+        mc = mpf.make_marketcolors(
+            up='#26a69a',
+            down='#ef5350',
+            edge='inherit',
+            wick='inherit',
+            volume='in'
+        )
+        
+        s = mpf.make_mpf_style(
+            marketcolors=mc,
+            gridstyle='-',
+            gridcolor='#333333',
+            facecolor='#1e1e1e',
+            figcolor='#1e1e1e',
+            gridaxis='both',
+            y_on_right=False
+        )
+        
+        # Chart बनवतो
+        fig, axes = mpf.plot(
+            df,
+            type='candle',
+            style=s,
+            volume=True,
+            title=f'\n{symbol} - Last {len(df)} Candles | Spot: ₹{spot_price:,.2f}',
+            ylabel='Price (₹)',
+            ylabel_lower='Volume',
+            figsize=(12, 8),
+            returnfig=True,
+            tight_layout=True
+        )
+        
+        # Title customize करतो
+        axes[0].set_title(
+            f'{symbol} - Last {len(df)} Candles | Spot: ₹{spot_price:,.2f}',
+            color='white',
+            fontsize=14,
+            fontweight='bold',
+            pad=20
+        )
+        
+        # Axes color
+        for ax in axes:
+            ax.tick_params(colors='white', which='both')
+            ax.spines['bottom'].set_color('white')
+            ax.spines['top'].set_color('white')
+            ax.spines['left'].set_color('white')
+            ax.spines['right'].set_color('white')
+            ax.xaxis.label.set_color('white')
+            ax.yaxis.label.set_color('white')
+        
+        # Memory buffer मध्ये save करतो
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', dpi=100, bbox_inches='tight', facecolor='#1e1e1e')
+        plt.close(fig)
+        
+        return buf.getvalue()
+        
+    except Exception as e:
+        logger.error("Error creating chart for %s: %s", symbol, e)
+        return None
+
+
+# ========================
+# DHAN HTTP RETRY
+# ========================
+
+class NoReadTimeoutRetry(Retry):
+    """urllib3 Retry - पण read timeout आला तर retry न करता लगेच raise करतो
+    
+    Server ने बंद केलेला keep-alive socket urllib3 ला read error (ProtocolError) म्हणून दिसतो,
+    म्हणून read budget ठेवतो; फक्त timeout वर एक call 3 x timeout REST worker धरून ठेवत नाही.
+    """
+    
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if isinstance(error, ReadTimeoutError):
+            raise error
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
 # ========================
 # BOT CODE
 # ========================
 
 class DhanOptionChainBot:
     def __init__(self):
-        self.bot = Bot(token=TELEGRAM_BOT_TOKEN)
+        # Telegram साठी एकच HTTPX connection pool - प्रत्येक message ला नवीन TLS handshake नको
+        self.bot = Bot(
+            token=TELEGRAM_BOT_TOKEN,
+            request=HTTPXRequest(connection_pool_size=8, http_version="1.1")
+        )
         self.running = True
+        self.stop_event = asyncio.Event()
         self.headers = {
             'access-token': DHAN_ACCESS_TOKEN,
             'client-id': DHAN_CLIENT_ID,
             'Content-Type': 'application/json',
-            'Accept': 'application/json'
+            'Accept': 'application/json',
+            # Compressed JSON मागतो - brotli installed असेल तर br सुद्धा (urllib3 आपोआप decompress करतो;
+            # requests चा default फक्त gzip, deflate असतो)
+            'Accept-Encoding': ACCEPT_ENCODING
         }
+        # Dhan API साठी एकच session - keep-alive मुळे प्रत्येक call ला नवीन TCP+TLS handshake लागत नाही
+        self.http = requests.Session()
+        self.http.headers.update(self.headers)
+        # Retry: idle keep-alive connection बंद झाला असेल (ProtocolError) किंवा Dhan 5xx देत असेल तर
+        # backoff ने परत try करतो (हे सगळे POST read-only queries आहेत; 429 dhan_post मध्ये Retry-After
+        # ने handle होतो - urllib3 ने retry केला तर Retry-After भर REST worker sleep मध्ये अडकला असता)
+        # Read timeout मात्र retry होत नाही (NoReadTimeoutRetry पहा)
+        retries = NoReadTimeoutRetry(
+            total=2,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=frozenset({'POST'}),
+            raise_on_status=False
+        )
+        self.http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retries))
+        self.rate_limited_until = 0.0
+        # Circuit breaker state (सलग Dhan failures)
+        self.dhan_failures = 0
+        self.breaker_open_until = 0.0
+        # symbol -> (data digest, value): data बदलला नसेल तर chart/message परत बनवत नाही
+        self.chart_cache = {}
+        self.message_cache = {}
+        # Chart rendering साठी एक worker process - पहिल्या chart वेळी सुरू होतो
+        self.chart_pool = None
+        self.pending_send = None
+        # symbol -> (monotonic fetch time, IST fetch time, expiry, option chain) - Dhan error वेळी stale data साठी
+        self.option_chain_cache = {}
+        # symbol -> शेवटचा यशस्वीरीत्या पाठवलेला (chart key, message digest)
+        self.sent_updates = {}
         self.security_id_map = {}
         logger.info("Bot initialized successfully")
     
@@ -94,105 +447,155 @@ class DhanOptionChainBot:
         """Dhan मधून security IDs load करतो (without pandas)"""
         try:
             logger.info("Loading security IDs from Dhan...")
-            response = requests.get(DHAN_INSTRUMENTS_URL, timeout=30)
-            
-            if response.status_code == 200:
-                # CSV parse करतो manually
-                csv_data = response.text.split('\n')
-                reader = csv.DictReader(csv_data)
-                
-                for symbol, info in STOCKS_INDICES.items():
-                    segment = info['segment']
-                    symbol_name = info['symbol']
+            # CSV मोठा आहे - पूर्ण text memory मध्ये न घेता lines stream करतो
+            with requests.get(DHAN_INSTRUMENTS_URL, timeout=30, stream=True) as response:
+                if response.status_code == 200:
+                    # CSV एकदाच scan करतो (प्रत्येक symbol साठी पूर्ण CSV परत वाचत नाही)
+                    # DictReader प्रत्येक row साठी dict बनवतो - plain reader + column indexes वापरतो
+                    response.encoding = 'utf-8'
+                    reader = csv.reader(response.iter_lines(decode_unicode=True))
+                    header = next(reader)
+                    seg_col = header.index('SEM_SEGMENT')
+                    exch_col = header.index('SEM_EXM_EXCH_ID')
+                    symbol_col = header.index('SEM_TRADING_SYMBOL')
+                    id_col = header.index('SEM_SMST_SECURITY_ID')
+                    min_len = max(seg_col, exch_col, symbol_col, id_col) + 1
                     
-                    # CSV मध्ये शोधतो
+                    found = {}
                     for row in reader:
-                        try:
-                            # Index साठी
-                            if segment == "IDX_I":
-                                if (row.get('SEM_SEGMENT') == 'I' and 
-                                    row.get('SEM_TRADING_SYMBOL') == symbol_name):
-                                    sec_id = row.get('SEM_SMST_SECURITY_ID')
-                                    if sec_id:
-                                        self.security_id_map[symbol] = {
-                                            'security_id': int(sec_id),
-                                            'segment': segment,
-                                            'trading_symbol': symbol_name
-                                        }
-                                        logger.info(f"✅ {symbol}: Security ID = {sec_id}")
-                                        break
-                            
-                            # Stock साठी
-                            else:
-                                if (row.get('SEM_SEGMENT') == 'E' and 
-                                    row.get('SEM_TRADING_SYMBOL') == symbol_name and
-                                    row.get('SEM_EXM_EXCH_ID') == 'NSE'):
-                                    sec_id = row.get('SEM_SMST_SECURITY_ID')
-                                    if sec_id:
-                                        self.security_id_map[symbol] = {
-                                            'security_id': int(sec_id),
-                                            'segment': segment,
-                                            'trading_symbol': symbol_name
-                                        }
-                                        logger.info(f"✅ {symbol}: Security ID = {sec_id}")
-                                        break
-                        except Exception as e:
+                        if len(row) < min_len:
                             continue
+                        
+                        csv_segment = row[seg_col]
+                        # Stocks फक्त NSE चे घेतो
+                        if csv_segment == 'E' and row[exch_col] != 'NSE':
+                            continue
+                        
+                        symbol = SCRIP_MASTER_KEYS.get((csv_segment, row[symbol_col]))
+                        if symbol is None or symbol in found:
+                            continue
+                        
+                        # Numeric ID असेल तरच घेतो (failed int() च्या exceptions टाळतो)
+                        # isdigit() '²' सारखे characters पण मानतो जे int() ला चालत नाहीत - isdecimal() वापरतो
+                        sec_id = row[id_col].strip()
+                        if sec_id.isdecimal():
+                            found[symbol] = int(sec_id)
+                            # सगळे symbols मिळाले - उरलेला CSV download/parse करायची गरज नाही
+                            if len(found) == len(SCRIP_MASTER_KEYS):
+                                break
                     
-                    # Reset CSV reader for next symbol
-                    csv_data_reset = response.text.split('\n')
-                    reader = csv.DictReader(csv_data_reset)
-                
-                logger.info(f"Total {len(self.security_id_map)} securities loaded")
-                return True
-            else:
-                logger.error(f"Failed to load instruments: {response.status_code}")
-                return False
+                    # STOCKS_INDICES च्या order मध्येच map भरतो
+                    for symbol, info in STOCKS_INDICES.items():
+                        if symbol in found:
+                            self.security_id_map[symbol] = {
+                                'security_id': found[symbol],
+                                'segment': info['segment'],
+                                'trading_symbol': info['symbol'],
+                                # Message header (Markdown escaped) एकदाच तयार करतो
+                                'header': f"📊 {bold_markdown(symbol + ' OPTION CHAIN')}\n",
+                                # Expiry list request body (already JSON encoded)
+                                'expiry_payload': json_dumps({
+                                    "UnderlyingScrip": found[symbol],
+                                    "UnderlyingSeg": info['segment']
+                                }),
+                                # Intraday API payload चा न बदलणारा भाग (5 min candles)
+                                'intraday_payload': {
+                                    "securityId": str(found[symbol]),
+                                    "exchangeSegment": info['segment'],
+                                    "instrument": INSTRUMENT_TYPES[info['segment']],
+                                    "interval": "5"
+                                }
+                            }
+                            logger.info("✅ %s: Security ID = %s", symbol, found[symbol])
+                    
+                    logger.info("Total %s securities loaded", len(self.security_id_map))
+                    return True
+                else:
+                    logger.error("Failed to load instruments: %s", response.status_code)
+                    return False
                 
         except Exception as e:
-            logger.error(f"Error loading security IDs: {e}")
+            logger.error("Error loading security IDs: %s", e)
             return False
     
-    def get_historical_data(self, security_id, segment, symbol):
+    def record_dhan_failure(self):
+        """Dhan failure मोजतो; सलग BREAKER_THRESHOLD failures झाले तर breaker open करतो
+        
+        Cooldown नंतरचा पहिला request trial असतो - तोही fail झाला तर breaker लगेच परत open होतो.
+        """
+        self.dhan_failures += 1
+        if self.dhan_failures >= BREAKER_THRESHOLD:
+            self.breaker_open_until = time.monotonic() + BREAKER_COOLDOWN
+            logger.warning(
+                "Dhan API failed %d times in a row - pausing requests for %ds",
+                self.dhan_failures, BREAKER_COOLDOWN
+            )
+    
+    def dhan_post(self, url, payload, timeout):
+        """Dhan API ला POST करतो; 429 आला तर Retry-After संपेपर्यंत पुढचे calls skip करतो
+        
+        payload dict असेल तर encode करतो, आधीच encode केलेले bytes तसेच पाठवतो.
+        """
+        remaining = self.rate_limited_until - time.monotonic()
+        if remaining > 0:
+            logger.warning("Dhan rate limit cooldown - skipping request (%.0fs left)", remaining)
+            return None
+        
+        # Circuit breaker open असेल तर Dhan ला hit न करता लगेच fail करतो
+        remaining = self.breaker_open_until - time.monotonic()
+        if remaining > 0:
+            logger.warning("Dhan circuit breaker open - skipping request (%.0fs left)", remaining)
+            return None
+        
+        # Body orjson ने encode करतो; Content-Type session headers मध्ये आधीच आहे
+        body = payload if isinstance(payload, bytes) else json_dumps(payload)
+        try:
+            response = self.http.post(url, data=body, timeout=timeout)
+        except requests.RequestException:
+            self.record_dhan_failure()
+            raise
+        
+        if response.status_code >= 500:
+            self.record_dhan_failure()
+        else:
+            self.dhan_failures = 0
+        
+        if response.status_code != 200:
+            # Dhan error body मध्ये errorCode/errorMessage असतो - diagnosis साठी log करतो
+            logger.warning("Dhan %s returned %s: %s", url, response.status_code, response_preview(response))
+        
+        if response.status_code == 429:
+            # Retry-After seconds मध्ये असतो; नसेल तर default cooldown
+            retry_after = to_float(response.headers.get('Retry-After'), default=RATE_LIMIT_COOLDOWN)
+            self.rate_limited_until = time.monotonic() + retry_after
+            logger.warning("Dhan rate limit hit - pausing requests for %.0fs", retry_after)
+        
+        return response
+    
+    def get_historical_data(self, symbol):
         """Last 5 days चे सर्व 5-minute candles घेतो"""
         try:
-            from datetime import datetime, timedelta
-            
-            # Exchange segment निवडतो
-            if segment == "IDX_I":
-                exch_seg = "IDX_I"
-                instrument = "INDEX"
-            else:
-                exch_seg = "NSE_EQ"
-                instrument = "EQUITY"
-            
             # Last 5 trading days साठी dates
             to_date = datetime.now()
             from_date = to_date - timedelta(days=7)  # 7 days back to ensure 5 trading days
             
-            # Intraday API साठी payload (5 min candles with date range)
+            # Intraday API साठी payload - static भाग load वेळीच तयार केलेला असतो
             payload = {
-                "securityId": str(security_id),
-                "exchangeSegment": exch_seg,
-                "instrument": instrument,
-                "interval": "5",  # 5 minute candles
+                **self.security_id_map[symbol]['intraday_payload'],
                 "fromDate": from_date.strftime("%Y-%m-%d"),
                 "toDate": to_date.strftime("%Y-%m-%d")
             }
             
-            logger.info(f"Intraday API call for {symbol}: {payload}")
+            logger.debug("Intraday API call for %s: %s", symbol, payload)
             
-            response = requests.post(
-                DHAN_INTRADAY_URL,
-                json=payload,
-                headers=self.headers,
-                timeout=15
-            )
+            response = self.dhan_post(DHAN_INTRADAY_URL, payload, timeout=15)
+            if response is None:
+                return None
             
-            logger.info(f"{symbol} Intraday response status: {response.status_code}")
+            logger.debug("%s Intraday response status: %s", symbol, response.status_code)
             
             if response.status_code == 200:
-                data = response.json()
+                data = json_loads(response.content)
                 
                 # Response format: {"open": [...], "high": [...], "low": [...], "close": [...], "volume": [...], "start_Time": [...]}
                 if 'open' in data and 'high' in data and 'low' in data and 'close' in data:
@@ -203,148 +606,60 @@ class DhanOptionChainBot:
                     volumes = data.get('volume', [])
                     timestamps = data.get('start_Time', [])
                     
-                    logger.info(f"{symbol}: Total arrays length - Open:{len(opens)}, Time:{len(timestamps)}")
+                    logger.debug("%s: Total arrays length - Open:%d, Time:%d", symbol, len(opens), len(timestamps))
                     
-                    # Candles तयार करतो
-                    candles = []
-                    for i in range(len(opens)):
-                        candles.append({
-                            'timestamp': timestamps[i] if i < len(timestamps) else '',
-                            'open': opens[i] if i < len(opens) else 0,
-                            'high': highs[i] if i < len(highs) else 0,
-                            'low': lows[i] if i < len(lows) else 0,
-                            'close': closes[i] if i < len(closes) else 0,
-                            'volume': volumes[i] if i < len(volumes) else 0
-                        })
+                    # Candles per-candle dicts न बनवता columns म्हणूनच ठेवतो (chart DataFrame पण columns मधून बनतो)
+                    # Arrays ची length open प्रमाणे - कमी असेल तर default ने pad करतो
+                    count = len(opens)
+                    candles = {}
+                    for column, values, default in zip(
+                        CANDLE_COLUMNS,
+                        (timestamps, opens, highs, lows, closes, volumes),
+                        ('', 0, 0, 0, 0, 0)
+                    ):
+                        values = values[:count]
+                        if len(values) < count:
+                            values = values + [default] * (count - len(values))
+                        candles[column] = values
                     
                     # सर्व available candles return करतो (no limit!)
-                    logger.info(f"{symbol}: Returning ALL {len(candles)} candles from last 5 days (5 min)")
+                    logger.info("%s: Returning ALL %s candles from last 5 days (5 min)", symbol, count)
                     return candles
                 else:
-                    logger.warning(f"{symbol}: Invalid response format - {str(data)[:200]}")
+                    logger.warning("%s: Invalid response format - %s", symbol, response_preview(response))
                     return None
             
-            logger.warning(f"{symbol}: Historical data नाही मिळाला - Status: {response.status_code}")
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error getting historical data for {symbol}: {e}")
+            logger.warning("%s: Historical data नाही मिळाला - Status: %s", symbol, response.status_code)
             return None
-    
-    def create_candlestick_chart(self, candles, symbol, spot_price):
-        """Candlestick chart तयार करतो"""
-        try:
-            # DataFrame तयार करतो
-            df_data = []
-            for candle in candles:
-                timestamp = candle.get('timestamp', candle.get('start_Time', ''))
-                df_data.append({
-                    'Date': pd.to_datetime(timestamp) if timestamp else pd.Timestamp.now(),
-                    'Open': float(candle.get('open', 0)),
-                    'High': float(candle.get('high', 0)),
-                    'Low': float(candle.get('low', 0)),
-                    'Close': float(candle.get('close', 0)),
-                    'Volume': int(float(candle.get('volume', 0)))  # Float to int conversion
-                })
-            
-            df = pd.DataFrame(df_data)
-            df.set_index('Date', inplace=True)
-            
-            # Check if enough data
-            if len(df) < 2:
-                logger.warning(f"{symbol}: Not enough candles ({len(df)}) for chart")
-                return None
-            
-            # Chart style
-            mc = mpf.make_marketcolors(
-                up='#26a69a',
-                down='#ef5350',
-                edge='inherit',
-                wick='inherit',
-                volume='in'
-            )
-            
-            s = mpf.make_mpf_style(
-                marketcolors=mc,
-                gridstyle='-',
-                gridcolor='#333333',
-                facecolor='#1e1e1e',
-                figcolor='#1e1e1e',
-                gridaxis='both',
-                y_on_right=False
-            )
-            
-            # Chart बनवतो
-            fig, axes = mpf.plot(
-                df,
-                type='candle',
-                style=s,
-                volume=True,
-                title=f'\n{symbol} - Last {len(candles)} Candles | Spot: ₹{spot_price:,.2f}',
-                ylabel='Price (₹)',
-                ylabel_lower='Volume',
-                figsize=(12, 8),
-                returnfig=True,
-                tight_layout=True
-            )
-            
-            # Title customize करतो
-            axes[0].set_title(
-                f'{symbol} - Last {len(candles)} Candles | Spot: ₹{spot_price:,.2f}',
-                color='white',
-                fontsize=14,
-                fontweight='bold',
-                pad=20
-            )
-            
-            # Axes color
-            for ax in axes:
-                ax.tick_params(colors='white', which='both')
-                ax.spines['bottom'].set_color('white')
-                ax.spines['top'].set_color('white')
-                ax.spines['left'].set_color('white')
-                ax.spines['right'].set_color('white')
-                ax.xaxis.label.set_color('white')
-                ax.yaxis.label.set_color('white')
-            
-            # Memory buffer मध्ये save करतो
-            buf = io.BytesIO()
-            fig.savefig(buf, format='png', dpi=100, bbox_inches='tight', facecolor='#1e1e1e')
-            buf.seek(0)
-            plt.close(fig)
-            
-            return buf
             
         except Exception as e:
-            logger.error(f"Error creating chart for {symbol}: {e}")
+            logger.error("Error getting historical data for %s: %s", symbol, e)
             return None
     
-    def get_nearest_expiry(self, security_id, segment):
+    def get_nearest_expiry(self, symbol):
         """सर्वात जवळचा expiry काढतो"""
         try:
-            payload = {
-                "UnderlyingScrip": security_id,
-                "UnderlyingSeg": segment
-            }
+            # Expiry list payload कधीच बदलत नाही - load वेळी encode केलेले bytes वापरतो
+            payload = self.security_id_map[symbol]['expiry_payload']
             
-            response = requests.post(
-                DHAN_EXPIRY_LIST_URL,
-                json=payload,
-                headers=self.headers,
-                timeout=10
-            )
+            response = self.dhan_post(DHAN_EXPIRY_LIST_URL, payload, timeout=10)
+            if response is None:
+                return None
             
             if response.status_code == 200:
-                data = response.json()
+                data = json_loads(response.content)
                 if data.get('status') == 'success' and data.get('data'):
                     expiries = data['data']
                     if expiries:
-                        return expiries[0]  # पहिला expiry = nearest
+                        # List sorted असेलच असं नाही - आज किंवा नंतरचा सर्वात जवळचा expiry (YYYY-MM-DD) घेतो
+                        today = datetime.now(IST).strftime("%Y-%m-%d")
+                        upcoming = [e for e in expiries if e >= today]
+                        return min(upcoming) if upcoming else expiries[0]
             
             return None
             
         except Exception as e:
-            logger.error(f"Error getting expiry: {e}")
+            logger.error("Error getting expiry: %s", e)
             return None
     
     def get_option_chain(self, security_id, segment, expiry):
@@ -356,166 +671,332 @@ class DhanOptionChainBot:
                 "Expiry": expiry
             }
             
-            response = requests.post(
-                DHAN_OPTION_CHAIN_URL,
-                json=payload,
-                headers=self.headers,
-                timeout=15
-            )
+            response = self.dhan_post(DHAN_OPTION_CHAIN_URL, payload, timeout=15)
+            if response is None:
+                return None
             
             if response.status_code == 200:
-                data = response.json()
+                data = json_loads(response.content)
                 if data.get('data'):
                     return data['data']
             
             return None
             
         except Exception as e:
-            logger.error(f"Error getting option chain: {e}")
+            logger.error("Error getting option chain: %s", e)
             return None
     
     def format_option_chain_message(self, symbol, data, expiry):
         """Option chain साठी सुंदर message format"""
         try:
-            spot_price = data.get('last_price', 0)
+            spot_price = to_float(data.get('last_price'))
             oc_data = data.get('oc', {})
             
             if not oc_data:
                 return None
             
-            # ATM strike शोधतो
-            strikes = sorted([float(s) for s in oc_data.keys()])
-            atm_strike = min(strikes, key=lambda x: abs(x - spot_price))
+            # Strike keys float ला एकदाच parse करतो, पण original string key सोबत ठेवतो
+            # (lookup साठी float परत string मध्ये format करावा लागत नाही)
+            strike_keys = sorted((float(key), key) for key in oc_data)
+            strikes = [strike for strike, _ in strike_keys]
+            
+            # ATM strike शोधतो - sorted strikes मध्ये bisect ने index थेट मिळतो
+            atm_idx = bisect.bisect_left(strikes, spot_price)
+            if atm_idx == len(strikes) or (
+                atm_idx > 0 and spot_price - strikes[atm_idx - 1] <= strikes[atm_idx] - spot_price
+            ):
+                atm_idx -= 1
+            atm_strike = strikes[atm_idx]
             
             # ATM च्या आजूबाजूचे 5 strikes घेतो (एकूण 11)
-            atm_idx = strikes.index(atm_strike)
             start_idx = max(0, atm_idx - 5)
             end_idx = min(len(strikes), atm_idx + 6)
-            selected_strikes = strikes[start_idx:end_idx]
-            
-            # Message तयार करतो
-            msg = f"📊 *{symbol} OPTION CHAIN*\n"
-            msg += f"📅 Expiry: {expiry}\n"
-            msg += f"💰 Spot: ₹{spot_price:,.2f}\n"
-            msg += f"🎯 ATM: ₹{atm_strike:,.0f}\n\n"
+            selected_strikes = strike_keys[start_idx:end_idx]
             
-            msg += "```\n"
-            msg += "Strike   CE-LTP  CE-OI  CE-Vol  PE-LTP  PE-OI  PE-Vol\n"
-            msg += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+            # Message lines list मध्ये जमवतो, शेवटी एकदाच join करतो
+            lines = [
+                self.security_id_map[symbol]['header'],
+                f"📅 Expiry: {escape_markdown(expiry)}\n",
+                f"💰 Spot: ₹{spot_price:,.2f}\n",
+                f"🎯 ATM: ₹{atm_strike:,.0f}\n\n",
+                OPTION_TABLE_HEADER
+            ]
             
-            for strike in selected_strikes:
-                strike_key = f"{strike:.6f}"
-                strike_data = oc_data.get(strike_key, {})
+            for strike, strike_key in selected_strikes:
+                strike_data = oc_data[strike_key]
                 
                 ce = strike_data.get('ce', {})
                 pe = strike_data.get('pe', {})
                 
-                ce_ltp = ce.get('last_price', 0)
-                ce_oi = ce.get('oi', 0)
-                ce_vol = ce.get('volume', 0)
-                
-                pe_ltp = pe.get('last_price', 0)
-                pe_oi = pe.get('oi', 0)
-                pe_vol = pe.get('volume', 0)
+                ce_ltp, ce_oi, ce_vol = option_leg_values(ce)
+                pe_ltp, pe_oi, pe_vol = option_leg_values(pe)
                 
                 # ATM mark करतो
                 atm_mark = "🔸" if strike == atm_strike else "  "
                 
-                msg += f"{atm_mark}{strike:6.0f}  {ce_ltp:6.1f} {ce_oi/1000:6.0f}K {ce_vol/1000:6.0f}K  {pe_ltp:6.1f} {pe_oi/1000:6.0f}K {pe_vol/1000:6.0f}K\n"
+                lines.append(OPTION_ROW_TEMPLATE % (
+                    atm_mark, strike,
+                    ce_ltp, ce_oi / 1000, ce_vol / 1000,
+                    pe_ltp, pe_oi / 1000, pe_vol / 1000
+                ))
             
-            msg += "```\n\n"
+            lines.append("```\n\n")
             
             # Greeks आणि IV (ATM साठी)
-            atm_data = oc_data.get(f"{atm_strike:.6f}", {})
+            atm_data = oc_data[strike_keys[atm_idx][1]]
             if atm_data:
                 ce_greeks = atm_data.get('ce', {}).get('greeks', {})
                 pe_greeks = atm_data.get('pe', {}).get('greeks', {})
-                ce_iv = atm_data.get('ce', {}).get('implied_volatility', 0)
-                pe_iv = atm_data.get('pe', {}).get('implied_volatility', 0)
+                ce_iv = to_float(atm_data.get('ce', {}).get('implied_volatility'))
+                pe_iv = to_float(atm_data.get('pe', {}).get('implied_volatility'))
                 
-                msg += "📈 *ATM Greeks & IV:*\n"
-                msg += f"CE: Δ={ce_greeks.get('delta', 0):.3f} Θ={ce_greeks.get('theta', 0):.2f} IV={ce_iv:.1f}%\n"
-                msg += f"PE: Δ={pe_greeks.get('delta', 0):.3f} Θ={pe_greeks.get('theta', 0):.2f} IV={pe_iv:.1f}%\n"
+                lines.append(ATM_GREEKS_HEADER)
+                lines.append(f"CE: Δ={to_float(ce_greeks.get('delta')):.3f} Θ={to_float(ce_greeks.get('theta')):.2f} IV={ce_iv:.1f}%\n")
+                lines.append(f"PE: Δ={to_float(pe_greeks.get('delta')):.3f} Θ={to_float(pe_greeks.get('theta')):.2f} IV={pe_iv:.1f}%\n")
             
-            return msg
+            return "".join(lines)
             
         except Exception as e:
-            logger.error(f"Error formatting message for {symbol}: {e}")
+            logger.error("Error formatting message for %s: %s", symbol, e)
             return None
     
+    async def fetch_expiry_and_option_chain(self, security_id, segment, symbol):
+        """Nearest expiry आणि त्याचा option chain thread मध्ये fetch करतो
+        
+        Dhan error आला तर OPTION_CHAIN_STALE_LIMIT पेक्षा जुना नसलेला शेवटचा चांगला data परत देतो.
+        Returns (expiry, oc_data, as_of) - as_of फक्त stale data साठी (fetch वेळ), fresh साठी None.
+        """
+        oc_data = None
+        expiry = await asyncio.to_thread(self.get_nearest_expiry, symbol)
+        if expiry:
+            logger.info("Fetching option chain for %s (Expiry: %s)...", symbol, expiry)
+            oc_data = await asyncio.to_thread(self.get_option_chain, security_id, segment, expiry)
+        
+        if oc_data:
+            self.option_chain_cache[symbol] = (time.monotonic(), datetime.now(IST), expiry, oc_data)
+            return expiry, oc_data, None
+        
+        cached = self.option_chain_cache.get(symbol)
+        if cached:
+            age = time.monotonic() - cached[0]
+            if age <= OPTION_CHAIN_STALE_LIMIT:
+                logger.warning("%s: Dhan fetch failed, using option chain from %.0fs ago", symbol, age)
+                return cached[2], cached[3], cached[1]
+        
+        return expiry, None, None
+    
+    async def telegram_send(self, send, **kwargs):
+        """Telegram API call chat ला पाठवतो - TELEGRAM_SEND_TIMEOUT मध्ये पूर्ण न झाला तर TimeoutError"""
+        return await asyncio.wait_for(
+            send(chat_id=TELEGRAM_CHAT_ID, **kwargs),
+            timeout=TELEGRAM_SEND_TIMEOUT
+        )
+    
+    async def send_symbol_update(self, symbol, chart_png, message, candle_count, update_key):
+        """एका symbol चा chart + option chain Telegram ला पाठवतो"""
+        try:
+            # Message caption मध्ये बसत असेल तर chart + option chain एकाच API call मध्ये पाठवतो
+            if chart_png and message and len(message) <= TELEGRAM_CAPTION_LIMIT:
+                await self.telegram_send(
+                    self.bot.send_photo,
+                    photo=chart_png,
+                    caption=message,
+                    parse_mode='Markdown'
+                )
+                logger.info("✅ %s chart + option chain sent", symbol)
+            else:
+                # Chart पाठवतो (जर available असेल तर)
+                if chart_png:
+                    await self.telegram_send(
+                        self.bot.send_photo,
+                        photo=chart_png,
+                        caption=f"📊 {symbol} - Last {candle_count} Candles Chart"
+                    )
+                    logger.info("✅ %s chart sent", symbol)
+                
+                if message:
+                    await self.telegram_send(
+                        self.bot.send_message,
+                        text=message,
+                        parse_mode='Markdown'
+                    )
+                    logger.info("✅ %s option chain sent", symbol)
+            
+            # यशस्वी send नंतरच record करतो - fail झाला तर पुढच्या cycle ला परत पाठवला जाईल
+            self.sent_updates[symbol] = update_key
+        except asyncio.TimeoutError:
+            logger.warning("%s: Telegram send timed out after %ss", symbol, TELEGRAM_SEND_TIMEOUT)
+        except Exception as e:
+            logger.error("Error sending %s update: %s", symbol, e)
+    
+    def get_chart_pool(self):
+        """Chart render करणारा single-worker process pool (lazy) परत देतो"""
+        if self.chart_pool is None:
+            self.chart_pool = ProcessPoolExecutor(max_workers=1)
+        return self.chart_pool
+    
+    async def render_chart(self, candles, symbol, spot_price):
+        """Chart process pool मध्ये render करतो - fail झाला तर None (message chart शिवाय जातो)"""
+        try:
+            # Rendering CPU-heavy आहे - वेगळ्या process मध्ये करतो म्हणजे GIL/event loop अडकत नाही
+            return await asyncio.get_running_loop().run_in_executor(
+                self.get_chart_pool(), render_candlestick_chart, candles, symbol, spot_price
+            )
+        except BrokenProcessPool as e:
+            # Worker मेला (OOM/crash) - pool टाकून देतो, पुढच्या chart ला नवीन pool बनतो
+            logger.error("Chart worker died while rendering %s: %s - restarting pool", symbol, e)
+            self.chart_pool.shutdown(wait=False, cancel_futures=True)
+            self.chart_pool = None
+        except Exception as e:
+            logger.error("Error rendering chart for %s: %s", symbol, e)
+        return None
+    
+    async def wait_for_pending_send(self):
+        """आधीचा background Telegram send चालू असेल तर तो पूर्ण होईपर्यंत थांबतो"""
+        if self.pending_send is not None:
+            await self.pending_send
+            self.pending_send = None
+    
     async def send_option_chain_batch(self, symbols_batch):
         """एका batch चे option chain data + chart पाठवतो"""
         for symbol in symbols_batch:
+            # Stop signal आला असेल तर cycle मध्येच थांबतो (उरलेले symbols skip)
+            if not self.running:
+                return
             try:
                 if symbol not in self.security_id_map:
-                    logger.warning(f"Skipping {symbol} - No security ID")
+                    logger.warning("Skipping %s - No security ID", symbol)
                     continue
                 
                 info = self.security_id_map[symbol]
                 security_id = info['security_id']
                 segment = info['segment']
                 
-                # Nearest expiry शोधतो
-                expiry = self.get_nearest_expiry(security_id, segment)
+                # Expiry + option chain आणि historical candles एकाच वेळी fetch करतो
+                # (blocking HTTP calls threads मध्ये, event loop block होत नाही)
+                logger.info("Fetching option chain and historical candles for %s...", symbol)
+                (expiry, oc_data, as_of), candles = await asyncio.gather(
+                    self.fetch_expiry_and_option_chain(security_id, segment, symbol),
+                    asyncio.to_thread(self.get_historical_data, symbol)
+                )
                 if not expiry:
-                    logger.warning(f"{symbol}: Expiry नाही मिळाला")
+                    logger.warning("%s: Expiry नाही मिळाला", symbol)
                     continue
                 
-                logger.info(f"Fetching data for {symbol} (Expiry: {expiry})...")
-                
-                # Option chain data घेतो
-                oc_data = self.get_option_chain(security_id, segment, expiry)
                 if not oc_data:
-                    logger.warning(f"{symbol}: Option chain data नाही मिळाला")
+                    logger.warning("%s: Option chain data नाही मिळाला", symbol)
                     continue
                 
-                spot_price = oc_data.get('last_price', 0)
+                spot_price = to_float(oc_data.get('last_price'))
                 
-                # Historical data घेतो (candles साठी)
-                logger.info(f"Fetching historical candles for {symbol}...")
-                candles = self.get_historical_data(security_id, segment, symbol)
+                # Chart तयार करतो - candles + spot बदलले नसतील तर मागचा PNG परत वापरतो
+                chart_png = None
+                chart_key = None
+                candle_count = len(candles['open']) if candles else 0
+                if candle_count and CHARTS_AVAILABLE:
+                    chart_key = (payload_digest(candles), spot_price)
+                    cached = self.chart_cache.get(symbol)
+                    if cached and cached[0] == chart_key:
+                        logger.info("%s: Candles unchanged, reusing cached chart", symbol)
+                        chart_png = cached[1]
+                    else:
+                        logger.info("Creating candlestick chart for %s...", symbol)
+                        chart_png = await self.render_chart(candles, symbol, spot_price)
+                        if chart_png:
+                            self.chart_cache[symbol] = (chart_key, chart_png)
                 
-                # Chart तयार करतो
-                chart_buf = None
-                if candles:
-                    logger.info(f"Creating candlestick chart for {symbol}...")
-                    chart_buf = self.create_candlestick_chart(candles, symbol, spot_price)
+                # Option chain message format करतो - data तसाच असेल तर cached message
+                message_key = payload_digest([expiry, oc_data])
+                cached = self.message_cache.get(symbol)
+                if cached and cached[0] == message_key:
+                    message = cached[1]
+                else:
+                    message = self.format_option_chain_message(symbol, oc_data, expiry)
+                    self.message_cache[symbol] = (message_key, message)
                 
-                # Chart पाठवतो (जर available असेल तर)
-                if chart_buf:
-                    await self.bot.send_photo(
-                        chat_id=TELEGRAM_CHAT_ID,
-                        photo=chart_buf,
-                        caption=f"📊 {symbol} - Last {len(candles)} Candles Chart"
-                    )
-                    logger.info(f"✅ {symbol} chart sent")
-                    await asyncio.sleep(1)
+                # Stale option chain असेल तर user ला दिसेल असा note जोडतो
+                if message and as_of:
+                    message += STALE_DATA_NOTE % as_of.strftime("%H:%M")
                 
-                # Option chain message format करतो
-                message = self.format_option_chain_message(symbol, oc_data, expiry)
-                if message:
-                    await self.bot.send_message(
-                        chat_id=TELEGRAM_CHAT_ID,
-                        text=message,
-                        parse_mode='Markdown'
+                # मागच्या वेळी पाठवलेलाच data असेल (market बंद) तर Telegram ला परत पाठवत नाही
+                # Chart render fail झाला असेल तर chart key record करत नाही - पुढच्या cycle ला chart सह परत पाठवतो
+                update_key = (chart_key if chart_png else None, message_key)
+                if self.sent_updates.get(symbol) == update_key:
+                    logger.info("%s: No change since last update, skipping send", symbol)
+                else:
+                    # Telegram send background मध्ये - पुढच्या symbol चा fetch लगेच सुरू होतो
+                    # (messages चा order राहावा म्हणून आधीचा send पूर्ण झाल्यावरच नवीन सुरू करतो)
+                    await self.wait_for_pending_send()
+                    self.pending_send = asyncio.create_task(
+                        self.send_symbol_update(symbol, chart_png, message, candle_count, update_key)
                     )
-                    logger.info(f"✅ {symbol} option chain sent")
                 
                 # Rate limit साठी थांबतो (3 seconds per request as per Dhan)
-                await asyncio.sleep(3)
+                await self.sleep_until_stopped(3)
                 
             except Exception as e:
-                logger.error(f"Error processing {symbol}: {e}")
-                await asyncio.sleep(3)
+                logger.error("Error processing %s: %s", symbol, e)
+                await self.sleep_until_stopped(3)
+    
+    def stop(self):
+        """Main loop थांबवतो (SIGTERM/SIGINT वर call होतो)"""
+        logger.info("Stop signal received, shutting down...")
+        self.running = False
+        self.stop_event.set()
+    
+    async def sleep_until_stopped(self, seconds):
+        """seconds भर थांबतो, पण stop signal आला तर लगेच परत येतो"""
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def initialize_telegram(self):
+        """Telegram client एकदाच initialize करतो (connection pool reuse होतो)"""
+        try:
+            await self.bot.initialize()
+            return True
+        except InvalidToken:
+            # चुकीचा token retry ने बरोबर होत नाही
+            raise
+        except TelegramError as e:
+            logger.error("Telegram initialize error: %s", e)
+            return False
+    
+    async def retry_with_backoff(self, step, what):
+        """step() True देईपर्यंत backoff ने परत try करतो - stop signal आला तर False"""
+        attempt = 0
+        while self.running:
+            if await step():
+                return True
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logger.error("Failed to %s. Retrying in %.0f seconds...", what, delay)
+            await self.sleep_until_stopped(delay)
+        return False
     
     async def run(self):
         """Main loop - every 5 minutes option chain + chart पाठवतो"""
         logger.info("🚀 Bot started! Loading security IDs...")
         
-        # Security IDs load करतो
-        success = await self.load_security_ids()
-        if not success:
-            logger.error("Failed to load security IDs. Exiting...")
+        loop = asyncio.get_running_loop()
+        
+        # to_thread फक्त Dhan REST calls साठी - एका वेळी जास्तीत जास्त 2 (expiry/option chain + historical)
+        loop.set_default_executor(
+            ThreadPoolExecutor(max_workers=REST_WORKERS, thread_name_prefix='dhan-rest')
+        )
+        
+        # Railway SIGTERM पाठवतो - sleep मधूनही लगेच बाहेर पडतो
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except NotImplementedError:
+                pass
+        
+        # Telegram client initialize + security IDs load - fail झाला तर exit/restart loop न करता backoff ने परत try करतो
+        if not (await self.retry_with_backoff(self.initialize_telegram, "initialize Telegram bot")
+                and await self.retry_with_backoff(self.load_security_ids, "load security IDs")):
+            await self.bot.shutdown()
             return
         
         await self.send_startup_message()
@@ -525,67 +1006,90 @@ class DhanOptionChainBot:
         batch_size = 5
         batches = [all_symbols[i:i+batch_size] for i in range(0, len(all_symbols), batch_size)]
         
-        logger.info(f"Total {len(all_symbols)} symbols in {len(batches)} batches")
+        logger.info("Total %s symbols in %s batches", len(all_symbols), len(batches))
         
+        next_cycle = time.monotonic()
+        errors = 0
         while self.running:
             try:
+                # Cycle deadline आधीच ठरवतो म्हणजे fetch/send चा वेळ interval मध्ये add होत नाही
+                next_cycle += UPDATE_INTERVAL
                 timestamp = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-                logger.info(f"\n{'='*50}")
-                logger.info(f"Starting update cycle at {timestamp}")
-                logger.info(f"{'='*50}")
+                logger.info("\n%s", '='*50)
+                logger.info("Starting update cycle at %s", timestamp)
+                logger.info("%s", '='*50)
                 
                 # प्रत्येक batch process करतो
                 for batch_num, batch in enumerate(batches, 1):
-                    logger.info(f"\n📦 Processing Batch {batch_num}/{len(batches)}: {batch}")
+                    if not self.running:
+                        break
+                    logger.info("\n📦 Processing Batch %s/%s: %s", batch_num, len(batches), batch)
                     await self.send_option_chain_batch(batch)
                     
                     # Batches मध्ये 5 second gap
                     if batch_num < len(batches):
-                        logger.info(f"Waiting 5 seconds before next batch...")
-                        await asyncio.sleep(5)
+                        logger.info("Waiting 5 seconds before next batch...")
+                        await self.sleep_until_stopped(5)
+                
+                if not self.running:
+                    break
                 
+                await self.wait_for_pending_send()
+                errors = 0
                 logger.info("\n✅ All batches completed!")
-                logger.info("⏳ Waiting 5 minutes for next cycle...\n")
                 
-                # 5 minutes wait
-                await asyncio.sleep(300)
+                # Cycle interval पेक्षा जास्त चालला तर backlog न करता पुढच्या slot पर्यंत थांबतो
+                now = time.monotonic()
+                while next_cycle <= now:
+                    logger.warning("Update cycle overran the interval, skipping a slot")
+                    next_cycle += UPDATE_INTERVAL
+                
+                wait = next_cycle - now
+                logger.info("⏳ Waiting %.0f seconds for next cycle...\n", wait)
+                
+                # Next cycle पर्यंत wait (stop signal आला तर लगेच बाहेर)
+                await self.sleep_until_stopped(wait)
                 
-            except KeyboardInterrupt:
-                logger.info("Bot stopped by user")
-                self.running = False
-                break
             except Exception as e:
-                logger.error(f"Error in main loop: {e}")
-                await asyncio.sleep(60)
+                delay = backoff_delay(errors)
+                errors += 1
+                logger.error("Error in main loop: %s (retrying in %.0f seconds)", e, delay)
+                await self.sleep_until_stopped(delay)
+                next_cycle = time.monotonic()
+        
+        await self.wait_for_pending_send()
+        if self.chart_pool is not None:
+            self.chart_pool.shutdown(cancel_futures=True)
+        await self.bot.shutdown()
+        logger.info("Bot stopped")
     
     async def send_startup_message(self):
         """Bot सुरू झाल्यावर message पाठवतो"""
         try:
-            msg = "🤖 *Dhan Option Chain Bot Started!*\n\n"
-            msg += f"📊 Tracking {len(self.security_id_map)} stocks/indices\n"
-            msg += "⏱️ Updates every 5 minutes\n"
-            msg += "📈 Features:\n"
-            msg += "  • Candlestick Charts (Last 199 candles)\n"
-            msg += "  • Option Chain: CE/PE LTP, OI, Volume\n"
-            msg += "  • Greeks & Implied Volatility\n\n"
-            msg += "✅ Powered by DhanHQ API v2\n"
-            msg += "🚂 Deployed on Railway.app\n\n"
-            msg += "_Market Hours: 9:15 AM - 3:30 PM (Mon-Fri)_"
+            msg = STARTUP_MESSAGE.format(count=len(self.security_id_map))
             
-            await self.bot.send_message(
-                chat_id=TELEGRAM_CHAT_ID,
+            await self.telegram_send(
+                self.bot.send_message,
                 text=msg,
                 parse_mode='Markdown'
             )
             logger.info("Startup message sent")
+        except asyncio.TimeoutError:
+            logger.warning("Startup message timed out after %ss", TELEGRAM_SEND_TIMEOUT)
         except Exception as e:
-            logger.error(f"Error sending startup message: {e}")
+            logger.error("Error sending startup message: %s", e)
 
 
 # ========================
 # BOT RUN करा
 # ========================
 if __name__ == "__main__":
+    # Deploy नंतर chart libraries खरंच import होतात का ते check करण्यासाठी
+    if "--selftest" in sys.argv:
+        load_chart_libs()
+        logger.info("✅ Selftest passed: chart libraries loaded")
+        sys.exit(0)
+    
     try:
         # Environment variables check
         if not all([TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, DHAN_CLIENT_ID, DHAN_ACCESS_TOKEN]):
@@ -594,14 +1098,14 @@ if __name__ == "__main__":
             exit(1)
         
         bot = DhanOptionChainBot()
-        asyncio.run(bot.run())
+        
+        # uvloop installed असेल तर faster event loop वापरतो
+        try:
+            import uvloop
+            run_loop = uvloop.run
+        except ImportError:
+            run_loop = asyncio.run
+        run_loop(bot.run())
     except Exception as e:
-        logger.error(f"Fatal error: {e}")
+        logger.error("Fatal error: %s", e)
         exit(1)
-
-# requirements.txt:
-# python-telegram-bot==20.7
-# requests==2.31.0
-# matplotlib==3.7.1
-# mplfinance==0.12.10b0
-# pandas==2.0.3